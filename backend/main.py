@@ -1,9 +1,24 @@
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
 from fastapi import FastAPI
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain.cache import SQLiteCache
+from langchain.globals import set_llm_cache
 
-app = FastAPI()
+load_dotenv()
+
+# Build the Gemini client and LLM cache once at startup, not on the first request
+@asynccontextmanager
+async def lifespan(app):
+    set_llm_cache(SQLiteCache(database_path=".llm_cache.db"))
+    app.state.llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", google_api_key=os.getenv("GEMINI_API_KEY"), transport="grpc")
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to AI Teaching Assistant API!"}
 
 # Run the server using: uvicorn main:app --reload
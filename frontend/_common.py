@@ -0,0 +1,252 @@
+import os
+import json
+import hashlib
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from dotenv import load_dotenv
+# Shared by app.py (Streamlit UI) and tasks.py (Celery worker), so nothing here imports Streamlit.
+# LangChain is only imported inside the functions that call it, so importing this module stays cheap.
+
+# ---------- Load API Key ----------
+load_dotenv()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = "gemini-1.5-pro-latest"
+
+# ---------- Gemini LLM via LangChain ----------
+# JSON mode makes Gemini emit a bare JSON document (no prose or code fences) that parses as-is.
+# It is bound per chain with llm.bind(generation_config=JSON_GENERATION_CONFIG), so JSON and
+# plain-text chains share one client
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+def make_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # gRPC keeps one persistent HTTP/2 channel per client, multiplexing concurrent calls over a single TLS connection
+    return ChatGoogleGenerativeAI(model=GEMINI_MODEL, google_api_key=GEMINI_API_KEY, transport="grpc")
+
+# ---------- Helper Function: Extract Text from PDF ----------
+# Large documents are split into page ranges across processes (MuPDF is not thread-safe).
+# A spawned worker costs ~0.55 s to start and import PyMuPDF, against ~1.3 ms per page read
+# in-process, so splitting only pays off at several hundred pages per worker
+MIN_PAGES_PER_WORKER = 500
+
+def extract_text_from_pdf(pdf_file):
+    # PDF libraries are imported here so pages and the Celery worker that never read PDFs skip loading them
+    try:
+        import pymupdf
+    except ImportError:
+        return _extract_text_with_pdfplumber(pdf_file)
+
+    pdf_bytes = pdf_file.getvalue()
+    try:
+        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+            page_count = doc.page_count
+            workers = min(os.cpu_count() or 1, page_count // MIN_PAGES_PER_WORKER)
+            if workers <= 1:
+                page_texts = [page.get_text() for page in doc]
+        if workers > 1:
+            page_texts = _extract_pages_in_parallel(pdf_bytes, page_count, workers)
+    except RuntimeError:
+        # MuPDF rejects some malformed files that pdfminer still reads
+        return _extract_text_with_pdfplumber(pdf_file)
+    return "\n".join(text for text in page_texts if text)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _extraction_pool():
+    # One pool per process, started on first use; its workers keep PyMuPDF imported between documents
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawn fresh interpreters: forking Streamlit's multi-threaded server process can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _extract_pages_in_parallel(pdf_bytes, page_count, workers):
+    bounds = [page_count * i // workers for i in range(workers + 1)]
+    ranges = _extraction_pool().map(_extract_page_range, repeat(pdf_bytes), bounds[:-1], bounds[1:])
+    return [text for page_texts in ranges for text in page_texts]
+
+def _extract_page_range(pdf_bytes, start, stop):
+    import pymupdf
+
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def _extract_text_with_pdfplumber(pdf_file):
+    import pdfplumber
+
+    parts = []
+    with pdfplumber.open(pdf_file) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            if page_text:
+                parts.append(page_text)
+            # Release the page's cached chars/layout instead of holding them until the file closes
+            page.close()
+    return "\n".join(parts)
+
+# ---------- Helper Function: Bounded On-Disk Result Cache ----------
+# Keeps results across sessions and restarts, one JSON file per call. Unlike st.cache_data(persist="disk"),
+# whose files are never removed, the least recently used files are evicted beyond DISK_CACHE_MAX_FILES
+DISK_CACHE_DIR = ".result_cache"
+DISK_CACHE_MAX_FILES = 256
+
+def disk_cached(func):
+    @functools.wraps(func)
+    def wrapper(*args):
+        digest = hashlib.sha256(func.__qualname__.encode())
+        for arg in args:
+            digest.update(b"\0")
+            digest.update(arg if isinstance(arg, bytes) else str(arg).encode())
+        path = os.path.join(DISK_CACHE_DIR, digest.hexdigest() + ".json")
+        try:
+            with open(path, encoding="utf-8") as cached:
+                result = json.load(cached)
+            os.utime(path)  # Mark as recently used
+            return result
+        except (OSError, ValueError):
+            pass
+        # A failed call raises before anything is written, so failures are never cached
+        result = func(*args)
+        os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as out:
+            json.dump(result, out)
+        os.replace(temp_path, path)
+        _evict_disk_cache()
+        return result
+    return wrapper
+
+def _evict_disk_cache():
+    entries = [entry for entry in os.scandir(DISK_CACHE_DIR) if entry.name.endswith(".json")]
+    if len(entries) <= DISK_CACHE_MAX_FILES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - DISK_CACHE_MAX_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass  # Already evicted by another session
+
+# ---------- Helper Function: Split Long Text into Chunks ----------
+def split_text(text, chunk_chars):
+    # Cut on line boundaries so a chunk never ends mid-sentence unless a single line is longer than a chunk
+    chunks, current, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        for start in range(0, len(line), chunk_chars):
+            piece = line[start:start + chunk_chars]
+            if current and size + len(piece) > chunk_chars:
+                chunks.append("".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+# ---------- Helper Function: Normalize Answers Before Evaluation ----------
+def normalize_answer(student_answer):
+    # Collapsing whitespace lets answers that differ only in spacing share a cached evaluation
+    return " ".join(student_answer.split())
+
+# ---------- Helper Function: Render Question/Answer Pairs for a Batch Prompt ----------
+def format_answer_pairs(pairs):
+    return "\n".join(
+        f"{idx}. Question: {question}\n   Student Answer: {normalize_answer(student_answer)}"
+        for idx, (question, student_answer) in enumerate(pairs, start=1)
+    )
+
+# ---------- Helper Functions: Run JSON-Mode Chains ----------
+# Parsed strictly: a response cut off at the token limit is not valid JSON and counts as a failure,
+# where a lenient parser would close the open strings and arrays and return a truncated object
+def parse_json_object(response_text):
+    try:
+        parsed = json.loads(response_text)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+def invoke_json(chain, inputs):
+    return parse_json_object(chain.invoke(inputs))
+
+def batch_json(chain, inputs_list):
+    return [parse_json_object(response_text) for response_text in chain.batch(inputs_list)]
+
+# ---------- Prompts ----------
+# Each template keeps its instructions as one static prefix and puts every {variable} after the
+# INPUT marker, so repeated calls share a byte-identical prefix that Gemini can cache.
+
+# ---------- Prompt: Condense One Section of a Long Document ----------
+CONDENSE_TEMPLATE = (
+    "You are an educational AI assistant. The content below is one section of a longer document. "
+    "Condense it into dense study notes that keep every key concept, definition, fact and example, in the order they appear. "
+    "Return only the condensed notes with no additional text.\n"
+    "\n---\nINPUT:\n"
+    "Content: {text}"
+)
+
+# ---------- Prompt: Summary, Personalized Notes, Questions and Diagram ----------
+COMBINED_TEMPLATE = (
+    "You are an educational AI assistant. Given the content below, generate a short summary, personalized notes in the style specified, 5 educational questions and a diagram based on it.\n\n"
+    "Return ONLY a valid JSON object with no additional text. The JSON must have exactly four keys: 'summary', 'questions', 'notes' and 'plantuml'.\n"
+    "The 'summary' value should be a string containing a concise summary of the content.\n"
+    "The 'notes' value should be a string containing the personalized notes in the given style.\n"
+    "The 'questions' value should be an array of exactly 5 strings, each a question.\n"
+    "The 'plantuml' value should be a string containing a diagram of the notes in standard PlantUML syntax. "
+    "Do not include any external references or libraries.\n"
+    "\n---\nINPUT:\n"
+    "Content: {text}\n\n"
+    "Style: {style}"
+)
+
+# ---------- Prompt: Flashcards ----------
+FLASHCARD_TEMPLATE = (
+    "You are an educational AI assistant. Based on the content below, generate a set of flashcards to help review key concepts. "
+    "Return ONLY a valid JSON object with one key 'flashcards'. The value should be an array of objects, each with keys 'question' and 'answer'.\n"
+    "\n---\nINPUT:\n"
+    "Content: {text}"
+)
+
+# ---------- Prompt: Evaluating an Answer ----------
+EVALUATION_TEMPLATE = (
+    "You are an educational AI assistant. Evaluate the student's answer for the question below objectively.\n"
+    "Also detect if the answer submitted by the student was AI generated; if yes, give a score of -1 with feedback as 'AI Generated Answer', otherwise, "
+    "provide a score between 0 and 5 with detailed feedback on how to improve the answer.\n"
+    "Return ONLY a valid JSON object with keys 'score' and 'feedback'.\n"
+    "\n---\nINPUT:\n"
+    "Question: {question}\n"
+    "Student Answer: {student_answer}"
+)
+
+# ---------- Prompt: Evaluating All Answers in One Call ----------
+BATCH_EVALUATION_TEMPLATE = (
+    "You are an educational AI assistant. Evaluate each of the student's answers to the numbered questions below objectively.\n"
+    "For each answer, also detect if it was AI generated; if yes, give a score of -1 with feedback as 'AI Generated Answer', otherwise, "
+    "provide a score between 0 and 5 with detailed feedback on how to improve the answer.\n"
+    "Return ONLY a valid JSON object with one key 'evaluations'. The value should be an array with one object per question, "
+    "in the same order as the questions, each with keys 'score' and 'feedback'.\n"
+    "\n---\nINPUT:\n"
+    "{pairs}"
+)
+
+# ---------- Prompt: Lesson Planning ----------
+LESSON_PLANNING_TEMPLATE = (
+    "You are an AI that assists teachers in creating lesson materials.\n\n"
+    "Instructions:\n"
+    "- If the plan type is 'Lesson Seed', provide a brief outline that the teacher can expand.\n"
+    "- If the plan type is 'Lesson Plan', provide a detailed lesson structure (objectives, activities, assessments).\n"
+    "- If the plan type is 'Unit Plan', outline a multi-week approach with subtopics and key activities.\n"
+    "- If the plan type is 'Plan by Number of Days', break the plan into day-by-day sections.\n\n"
+    "Return only the plan details with minimal additional text.\n"
+    "\n---\nINPUT:\n"
+    "Plan Type: {plan_type}\n"
+    "Subject: {subject}\n"
+    "Grade Level: {grade_level}\n"
+    "Objectives: {objectives}\n"
+    "Number of Days: {num_days}"
+)
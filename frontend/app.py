@@ -1,199 +1,295 @@
 import streamlit as st
-import pdfplumber
 import os
-import json
-import re
-import tempfile
 import subprocess
 import io
-import pandas as pd
-import matplotlib.pyplot as plt
+import urllib.request
+import hashlib
+from types import SimpleNamespace
 import numpy as np
-import time
-from dotenv import load_dotenv
-import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from _common import *
 # (Assuming you have installed and set up all necessary packages)
 
-# ---------- Load API Key ----------
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# ---------- Initialize Gemini LLM via LangChain ----------
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", google_api_key=GEMINI_API_KEY)
-
-# ---------- Helper Function: Extract Text from PDF ----------
-def extract_text_from_pdf(pdf_file):
-    text = ""
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
+# ---------- Helper Function: Extract Text from PDF (cached by file contents) ----------
+# Kept on disk so a re-upload of the same PDF skips extraction across sessions and restarts
+@st.cache_data(show_spinner="Extracting text...", max_entries=64)
+@disk_cached
+def extract_text_cached(file_bytes):
+    return extract_text_from_pdf(io.BytesIO(file_bytes))
+
+# ---------- Helper Function: Fit Long Documents into One Prompt ----------
+MAX_INPUT_TOKENS = 32_000
+CHUNK_TOKENS = 8_000
+MAX_CONDENSE_ROUNDS = 3
+MAX_CONDENSE_CONCURRENCY = 8
+
+def fit_to_context(text):
+    # A token is at least one character, so short text fits without a count_tokens round-trip
+    if len(text) <= MAX_INPUT_TOKENS:
+        return text
+    return _condense_to_fit(text)
+
+@st.cache_data(show_spinner="Condensing long document...", max_entries=64)
+@disk_cached
+def _condense_to_fit(text):
+    chains = _build_chains()
+    total_tokens = chains.llm.get_num_tokens(text)
+    rounds = 0
+    while total_tokens > MAX_INPUT_TOKENS:
+        if rounds == MAX_CONDENSE_ROUNDS:
+            # Last resort when condensing stops shrinking the text: keep what fits
+            return text[:len(text) * MAX_INPUT_TOKENS // total_tokens]
+        # One count per round gives the characters-per-token ratio used to size the chunks,
+        # then the sections are condensed concurrently (a few at a time) and joined in order
+        chunk_chars = max(1, len(text) * CHUNK_TOKENS // total_tokens)
+        chunks = split_text(text, chunk_chars)
+        condensed = chains.condense.batch(
+            [{"text": chunk} for chunk in chunks],
+            config={"max_concurrency": MAX_CONDENSE_CONCURRENCY}
+        )
+        text = "\n\n".join(condensed)
+        total_tokens = chains.llm.get_num_tokens(text)
+        rounds += 1
     return text
 
-# ---------- Helper Function: Parse JSON from Response ----------
-def parse_json_response(response_text):
-    try:
-        cleaned_text = re.sub(r'[\x00-\x1F]+', '', response_text)
-        json_str = re.search(r'\{.*\}', cleaned_text, re.DOTALL).group()
-        return json.loads(json_str)
-    except Exception as e:
-        st.error("Error parsing JSON: " + str(e))
-        return None
+# ---------- Helper Function: Stream a JSON Response ----------
+def stream_json_response(chain, inputs):
+    # Shows progress while the response is generated, then parses the complete text strictly
+    buffer = io.StringIO()
+    progress = st.empty()
+    for chunk in chain.stream(inputs):
+        buffer.write(chunk)
+        progress.caption(f"Receiving response... {buffer.tell():,} characters")
+    progress.empty()
+    return parse_json_object(buffer.getvalue())
 
-# ---------- Combined Chain for Generating Personalized Notes and Questions ----------
-combined_prompt = PromptTemplate(
-    input_variables=["text", "style"],
-    template=(
-        "You are an educational AI assistant. Given the following content, generate personalized notes in the style specified and 5 educational questions based on it.\n\n"
-        "Style: {style}\n\n"
-        "Return ONLY a valid JSON object with no additional text. The JSON must have exactly two keys: 'notes' and 'questions'.\n"
-        "The 'notes' value should be a string containing the personalized notes in the given style.\n"
-        "The 'questions' value should be an array of exactly 5 strings, each a question.\n\n"
-        "Content: {text}"
-    )
-)
-combined_chain = LLMChain(llm=llm, prompt=combined_prompt)
+# ---------- Combined Chain for Generating Summary, Personalized Notes, Questions and Diagram ----------
+CONTENT_KEYS = {"summary", "questions", "notes", "plantuml"}
 
+# Streamed calls bypass the LLM cache, so results are kept on disk here instead
+@st.cache_data(show_spinner=False, max_entries=64)
+@disk_cached
 def generate_content(text, style):
-    response_text = combined_chain.run({"text": text, "style": style})
-    parsed = parse_json_response(response_text)
-    if parsed:
-        notes = parsed.get("notes", "")
-        questions = parsed.get("questions", [])
-        return notes, questions
+    parsed = stream_json_response(_build_chains().combined, {"text": text, "style": style})
+    if (
+        parsed
+        and CONTENT_KEYS <= parsed.keys()
+        and all(isinstance(parsed[key], str) for key in ("summary", "notes", "plantuml"))
+        and parsed["notes"]
+        and isinstance(parsed["questions"], list)
+        and len(parsed["questions"]) == 5
+        and all(isinstance(question, str) for question in parsed["questions"])
+    ):
+        return parsed["summary"], parsed["questions"], parsed["notes"], parsed["plantuml"]
     else:
-        st.error("Failed to parse JSON output from the AI. Please try again.")
-        return None, None
+        # Raising keeps the failure out of the cache, so "try again" really retries
+        raise ValueError("Failed to parse JSON output from the AI. Please try again.")
 
 # ---------- Chain for Flashcards Generation ----------
-flashcard_prompt = PromptTemplate(
-    input_variables=["text"],
-    template=(
-        "You are an educational AI assistant. Based on the following content, generate a set of flashcards to help review key concepts. "
-        "Return ONLY a valid JSON object with one key 'flashcards'. The value should be an array of objects, each with keys 'question' and 'answer'.\n\n"
-        "Content: {text}"
-    )
-)
-flashcard_chain = LLMChain(llm=llm, prompt=flashcard_prompt)
-
+@st.cache_data(show_spinner=False, max_entries=64)
+@disk_cached
 def generate_flashcards(text):
-    response_text = flashcard_chain.run(text)
-    parsed = parse_json_response(response_text)
-    if parsed and "flashcards" in parsed:
+    parsed = stream_json_response(_build_chains().flashcard, {"text": text})
+    if parsed and parsed.get("flashcards"):
         return parsed["flashcards"]
     else:
-        st.error("Failed to generate flashcards.")
+        raise ValueError("Failed to generate flashcards.")
+
+# ---------- Helper Function: Validate an Evaluation ----------
+def checked_evaluation(evaluation):
+    # JSON mode guarantees valid JSON, not a usable score; the model may also return scores as strings.
+    # -1 marks an AI-generated answer, otherwise scores run from 0 to 5
+    if not isinstance(evaluation, dict):
+        return None
+    try:
+        score = int(float(evaluation.get("score")))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not -1 <= score <= 5:
         return None
+    return {**evaluation, "score": score}
 
 # ---------- Chain for Evaluating Answers ----------
-evaluation_prompt = PromptTemplate(
-    input_variables=["question", "student_answer"],
-    template=(
-        "You are an educational AI assistant. Evaluate the student's answer for the following question objectively.\n"
-        "Question: {question}\n"
-        "Student Answer: {student_answer}\n"
-        "Also detect if the answer submitted by the student was AI generated; if yes, give a score of -1 with feedback as 'AI Generated Answer', otherwise, "
-        "provide a score between 0 and 5 with detailed feedback on how to improve the answer.\n"
-        "Return ONLY a valid JSON object with keys 'score' and 'feedback'."
-    )
-)
-evaluation_chain = LLMChain(llm=llm, prompt=evaluation_prompt)
-
 def evaluate_answer(question, student_answer):
-    response_text = evaluation_chain.run({"question": question, "student_answer": student_answer})
-    return parse_json_response(response_text)
-
-# ---------- New Chain for Generating PlantUML Code (Visual Insights) ----------
-plantuml_prompt = PromptTemplate(
-    input_variables=["notes"],
-    template=(
-        "You are an expert in UML diagramming. Given the following educational content, "
-        "generate a diagram in standard PlantUML syntax. Do not include any external references or libraries. "
-        "Return ONLY the PlantUML code.\n\n"
-        "Content: {notes}"
-    )
-)
-plantuml_chain = LLMChain(llm=llm, prompt=plantuml_prompt)
+    chains = _build_chains()
+    inputs = {"question": question, "student_answer": normalize_answer(student_answer)}
+    evaluation = checked_evaluation(invoke_json(chains.evaluation, inputs))
+    if evaluation is None:
+        # The rejected response is already in the LLM cache, so the retry has to bypass it
+        evaluation = checked_evaluation(invoke_json(chains.evaluation_retry, inputs))
+    if evaluation is None:
+        st.error("Failed to evaluate answer. Please try again.")
+    return evaluation
 
-def generate_plantuml_code(notes):
-    return plantuml_chain.run({"notes": notes})
+# ---------- Chain for Evaluating All Answers in One Call ----------
+def evaluate_answers_batch(pairs):
+    chains = _build_chains()
+    parsed = invoke_json(chains.batch_evaluation, {"pairs": format_answer_pairs(pairs)})
+    if isinstance(parsed, dict) and isinstance(parsed.get("evaluations"), list) and len(parsed["evaluations"]) == len(pairs):
+        evaluations = [checked_evaluation(evaluation) for evaluation in parsed["evaluations"]]
+        if all(evaluations):
+            return evaluations
+    # Fall back to one call per answer; batch() runs them concurrently so the wait is one call's latency
+    inputs_list = [
+        {"question": question, "student_answer": normalize_answer(student_answer)}
+        for question, student_answer in pairs
+    ]
+    evaluations = [checked_evaluation(evaluation) for evaluation in batch_json(chains.evaluation, inputs_list)]
+    failed = [idx for idx, evaluation in enumerate(evaluations) if evaluation is None]
+    if failed:
+        # Retry rejected answers past the LLM cache, which already holds their bad responses
+        retried = batch_json(chains.evaluation_retry, [inputs_list[idx] for idx in failed])
+        for idx, evaluation in zip(failed, retried):
+            evaluations[idx] = checked_evaluation(evaluation)
+    if all(evaluations):
+        return evaluations
+    else:
+        st.error("Failed to evaluate answers. Please try again.")
+        return None
+
+# ---------- Helper Function: Store an Evaluation with the Answer It Scored ----------
+def record_evaluation(answer_key, question, student_answer, evaluation):
+    score = np.int8(evaluation["score"])
+    evaluations = st.session_state["evaluations"]
+    evaluations[answer_key] = {
+        "question": question,
+        "ans_hash": answer_hash(student_answer),
+        "score": evaluation["score"],
+        "feedback": evaluation.get("feedback")
+    }
+    # score_array mirrors the evaluations' insertion order so the Dashboard can mask it in one vectorized step
+    position = list(evaluations).index(answer_key)
+    if position == len(st.session_state["score_array"]):
+        st.session_state["score_array"] = np.append(st.session_state["score_array"], score)
+    else:
+        st.session_state["score_array"][position] = score
+
+# A short digest of the normalized answer is enough to spot an unchanged re-submit,
+# so the session doesn't keep a second copy of every answer's text
+def answer_hash(student_answer):
+    return hashlib.sha1(normalize_answer(student_answer).encode()).hexdigest()[:16]
+
+def is_evaluated(answer_key, question, student_answer):
+    previous = st.session_state["evaluations"].get(answer_key)
+    return previous is not None and (previous["question"], previous["ans_hash"]) == (question, answer_hash(student_answer))
+
+# ---------- Rendering PlantUML Code (Visual Insights) ----------
+# A long-running PlantUML server renders without starting a JVM per diagram, e.g. run
+# `java -jar plantuml.jar -picoweb:8080:localhost` and set PLANTUML_SERVER_URL=http://localhost:8080/plantuml/png
+PLANTUML_SERVER_URL = os.getenv("PLANTUML_SERVER_URL")
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def generate_uml(uml_code):
+    if PLANTUML_SERVER_URL:
+        request = urllib.request.Request(
+            PLANTUML_SERVER_URL,
+            data=uml_code.encode(),
+            headers={"Content-Type": "text/plain; charset=utf-8"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.read()
+        except OSError:
+            pass  # Server is down; render with the command-line tool instead
 
-def generate_uml(uml_code, output_filename="diagram.png"):
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.uml', delete=False) as temp_file:
-        uml_filepath = temp_file.name
-        temp_file.write(uml_code)
-    
     # Specify the full path to the PlantUML executable
     plantuml_executable = r"C:\ProgramData\chocolatey\bin\plantuml.cmd"
-    command = [plantuml_executable, '-tpng', uml_filepath]
+    # -pipe reads the diagram from stdin and writes the PNG to stdout, so nothing touches the disk
+    command = [plantuml_executable, '-tpng', '-pipe']
     
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    result = subprocess.run(command, input=uml_code.encode(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     
-    if result.returncode != 0:
-        st.error("Error generating UML diagram: " + result.stderr.decode())
-        os.remove(uml_filepath)
-        return None
-    
-    generated_filepath = uml_filepath.replace('.uml', '.png')
-    if os.path.exists(generated_filepath):
-        os.rename(generated_filepath, output_filename)
-        os.remove(uml_filepath)
-        return output_filename
-    else:
-        st.error("Diagram file not found.")
-        os.remove(uml_filepath)
-        return None
+    if result.returncode != 0 or not result.stdout:
+        raise ValueError("Error generating UML diagram: " + result.stderr.decode())
+    return result.stdout
 
 
 # ---------- New Chain for Lesson Planning ----------
-lesson_planning_prompt = PromptTemplate(
-    input_variables=["plan_type", "subject", "grade_level", "objectives", "num_days"],
-    template=(
-        "You are an AI that assists teachers in creating lesson materials.\n\n"
-        "Plan Type: {plan_type}\n"
-        "Subject: {subject}\n"
-        "Grade Level: {grade_level}\n"
-        "Objectives: {objectives}\n"
-        "Number of Days: {num_days}\n\n"
-        "Instructions:\n"
-        "- If the plan type is 'Lesson Seed', provide a brief outline that the teacher can expand.\n"
-        "- If the plan type is 'Lesson Plan', provide a detailed lesson structure (objectives, activities, assessments).\n"
-        "- If the plan type is 'Unit Plan', outline a multi-week approach with subtopics and key activities.\n"
-        "- If the plan type is 'Plan by Number of Days', break the plan into day-by-day sections.\n\n"
-        "Return only the plan details with minimal additional text."
-    )
-)
-lesson_planning_chain = LLMChain(llm=llm, prompt=lesson_planning_prompt)
-
 def generate_lesson_plan(plan_type, subject, grade_level, objectives, num_days):
-    response = lesson_planning_chain.run({
+    # Yields text as Gemini decodes it, so the plan can be shown while it is being written
+    yield from _build_chains().lesson_planning.stream({
         "plan_type": plan_type,
         "subject": subject,
         "grade_level": grade_level,
         "objectives": objectives,
         "num_days": num_days
     })
-    return response
+
+# ---------- Helper Function: Dashboard Statistics ----------
+def dashboard_stats(scores):
+    # Vectorized reductions over the score array; -1 marks an AI-generated answer and is left out of the average
+    weak_mask = scores < 3
+    graded = scores[scores >= 0].astype(np.float64)
+    if graded.size == 0:
+        return weak_mask, 0.0, 0.0
+    return weak_mask, float(graded.mean()), float(graded.std())
+
+# ---------- Dashboard Chart Settings ----------
+BREAKDOWN_LABELS = ["Strong", "Weak"]
+BREAKDOWN_COLORS = ["#4CAF50", "#FF5733"]
+
+# Vega-Lite renders the chart in the browser, so no figure is rasterized on each rerun;
+# the chart object itself is built once per distinct breakdown and reused across reruns
+@st.cache_resource(max_entries=64)
+def breakdown_chart(strong, weak):
+    import altair as alt
+
+    return alt.Chart(alt.Data(values=[
+        {"category": label, "count": count}
+        for label, count in zip(BREAKDOWN_LABELS, (strong, weak))
+    ])).mark_arc().encode(
+        theta="count:Q",
+        color=alt.Color("category:N", scale=alt.Scale(domain=BREAKDOWN_LABELS, range=BREAKDOWN_COLORS)),
+        tooltip=["category:N", "count:Q"]
+    )
+
+# ---------- Initialize Gemini LLM and Chains (once per process, on first use) ----------
+# LangChain is imported here rather than at the top, so pages that never call the LLM
+# (Dashboard, Visual Insights) render without paying for it
+@st.cache_resource
+def _build_chains():
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain.cache import SQLiteCache
+    from langchain.globals import set_llm_cache
+
+    # Identical prompts are answered from the cache instead of the API
+    set_llm_cache(SQLiteCache(database_path=".llm_cache.db"))
+    llm = make_llm()
+    json_llm = llm.bind(generation_config=JSON_GENERATION_CONFIG)
+    # Retries of rejected evaluations skip the cache; the copy shares the client and its gRPC channel
+    uncached_json_llm = llm.model_copy(update={"cache": False}).bind(generation_config=JSON_GENERATION_CONFIG)
+    return SimpleNamespace(
+        llm=llm,
+        combined=PromptTemplate.from_template(COMBINED_TEMPLATE) | json_llm | StrOutputParser(),
+        flashcard=PromptTemplate.from_template(FLASHCARD_TEMPLATE) | json_llm | StrOutputParser(),
+        evaluation=PromptTemplate.from_template(EVALUATION_TEMPLATE) | json_llm | StrOutputParser(),
+        batch_evaluation=PromptTemplate.from_template(BATCH_EVALUATION_TEMPLATE) | json_llm | StrOutputParser(),
+        evaluation_retry=PromptTemplate.from_template(EVALUATION_TEMPLATE) | uncached_json_llm | StrOutputParser(),
+        lesson_planning=PromptTemplate.from_template(LESSON_PLANNING_TEMPLATE) | llm | StrOutputParser(),
+        condense=PromptTemplate.from_template(CONDENSE_TEMPLATE) | llm | StrOutputParser(),
+    )
 
 # ---------- Initialize session_state Variables ----------
+if "summary" not in st.session_state:
+    st.session_state["summary"] = ""
 if "notes" not in st.session_state:
     st.session_state["notes"] = ""
 if "questions" not in st.session_state:
     st.session_state["questions"] = []
 if "evaluations" not in st.session_state:
     st.session_state["evaluations"] = {}
+if "score_array" not in st.session_state:
+    st.session_state["score_array"] = np.empty(0, dtype=np.int8)
 if "plantuml_code" not in st.session_state:
     st.session_state["plantuml_code"] = ""
-if "diagram_path" not in st.session_state:
-    st.session_state["diagram_path"] = ""
+if "diagram" not in st.session_state:
+    st.session_state["diagram"] = None
 if "show_uml_code" not in st.session_state:
     st.session_state["show_uml_code"] = False
 if "lesson_plan" not in st.session_state:
     st.session_state["lesson_plan"] = ""
+if "lesson_plan_inputs" not in st.session_state:
+    st.session_state["lesson_plan_inputs"] = None
 if "flashcards" not in st.session_state:
     st.session_state["flashcards"] = []
 
@@ -217,17 +313,32 @@ if page == "Generate Content":
     selected_style = st.selectbox("Choose a style for personalized notes:", style_options)
     
     if uploaded_file:
-        with st.spinner("Extracting text..."):
-            extracted_text = extract_text_from_pdf(uploaded_file)
+        extracted_text = extract_text_cached(uploaded_file.getvalue())
         if extracted_text:
             st.success("Text extracted successfully!")
             st.text_area("Extracted Text (Preview)", extracted_text[:1000], height=200)
             if st.button("Generate Content"):
-                with st.spinner("Generating personalized notes and questions..."):
-                    notes, questions = generate_content(extracted_text, selected_style)
-                if notes and questions:
+                try:
+                    content_text = fit_to_context(extracted_text)
+                except Exception as e:
+                    # Condensing a long document makes many model calls; report a failed one instead of crashing
+                    st.error(f"Failed to condense the document. Please try again. ({e})")
+                    st.stop()
+                try:
+                    with st.spinner("Generating summary, personalized notes, questions and diagram..."):
+                        summary, questions, notes, plantuml_code = generate_content(content_text, selected_style)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state["summary"] = summary
                     st.session_state["notes"] = notes
                     st.session_state["questions"] = questions
+                    # The diagram code arrives with the notes; the old rendered diagram is stale
+                    st.session_state["plantuml_code"] = plantuml_code
+                    st.session_state["diagram"] = None
+                    if summary:
+                        st.subheader("📄 AI-Generated Summary")
+                        st.write(summary)
                     st.subheader("📝 AI-Generated Personalized Notes")
                     st.write(notes)
 
@@ -238,14 +349,15 @@ elif page == "Flashcards":
         st.warning("No content generated. Please generate content first.")
     else:
         st.subheader("Flashcards Generated from Content")
-        flashcards = generate_flashcards(st.session_state["notes"])
-        if flashcards:
+        try:
+            flashcards = generate_flashcards(st.session_state["notes"])
+        except ValueError as e:
+            st.error(str(e))
+        else:
             st.session_state["flashcards"] = flashcards
             for idx, card in enumerate(flashcards, start=1):
                 with st.expander(f"Flashcard {idx}: {card.get('question', 'No Question Provided')}"):
                     st.write("**Answer:**", card.get("answer", "No Answer Provided"))
-        else:
-            st.error("Flashcards could not be generated.")
 
 # ---------- Page 3: Questionnaire and Evaluation ----------
 elif page == "Questionnaire":
@@ -254,23 +366,48 @@ elif page == "Questionnaire":
         st.warning("No content generated. Please generate content first.")
     else:
         st.subheader("Answer the Following Questions")
-        for idx, question in enumerate(st.session_state["questions"], start=1):
-            st.markdown(f"**Question {idx}:** {question}")
-            answer_key = f"q{idx}"
-            student_answer = st.text_area(f"Your Answer for Question {idx}", key=answer_key)
-            if st.button(f"Submit Answer {idx}", key=f"btn_{idx}"):
-                if not student_answer.strip():
-                    st.error("Please enter an answer before submitting.")
-                else:
-                    with st.spinner("Evaluating answer..."):
-                        evaluation = evaluate_answer(question, student_answer)
-                    if evaluation:
-                        st.success(f"Score: {evaluation.get('score')}")
-                        st.info(f"Feedback: {evaluation.get('feedback')}")
-                        st.session_state["evaluations"][answer_key] = {
-                            "score": evaluation.get("score"),
-                            "feedback": evaluation.get("feedback")
-                        }
+        questions = st.session_state["questions"]
+        # Answers live in a form so typing doesn't rerun the script until a submit button is pressed
+        submitted = []
+        with st.form("answers_form"):
+            for idx, question in enumerate(questions, start=1):
+                st.markdown(f"**Question {idx}:** {question}")
+                st.text_area(f"Your Answer for Question {idx}", key=f"q{idx}")
+                if st.form_submit_button(f"Submit Answer {idx}"):
+                    submitted = [idx]
+            if st.form_submit_button("Submit All Answers"):
+                submitted = list(range(1, len(questions) + 1))
+        answered = [
+            (f"q{idx}", questions[idx - 1], st.session_state.get(f"q{idx}", ""))
+            for idx in submitted
+        ]
+        answered = [(key, q, a) for key, q, a in answered if a.strip()]
+        if submitted and not answered:
+            st.error("Please enter an answer before submitting.")
+        elif len(answered) == 1:
+            answer_key, question, student_answer = answered[0]
+            # Re-submitting an unchanged answer reuses its evaluation instead of calling Gemini again
+            if is_evaluated(answer_key, question, student_answer):
+                evaluation = st.session_state["evaluations"][answer_key]
+            else:
+                with st.spinner("Evaluating answer..."):
+                    evaluation = evaluate_answer(question, student_answer)
+                if evaluation:
+                    record_evaluation(answer_key, question, student_answer, evaluation)
+            if evaluation:
+                st.success(f"Score: {evaluation.get('score')}")
+                st.info(f"Feedback: {evaluation.get('feedback')}")
+        elif answered:
+            pending = [(key, q, a) for key, q, a in answered if not is_evaluated(key, q, a)]
+            if not pending:
+                st.info("These answers have already been evaluated.")
+            else:
+                with st.spinner("Evaluating answers..."):
+                    evaluations = evaluate_answers_batch([(q, a) for _, q, a in pending])
+                if evaluations:
+                    for (answer_key, question, student_answer), evaluation in zip(pending, evaluations):
+                        record_evaluation(answer_key, question, student_answer, evaluation)
+                    st.success(f"Evaluated {len(evaluations)} answers.")
         with st.expander("Show All Evaluations"):
             if st.session_state["evaluations"]:
                 for key, eval_data in st.session_state["evaluations"].items():
@@ -284,20 +421,23 @@ elif page == "Dashboard":
     if not st.session_state["evaluations"]:
         st.warning("No evaluations available. Please complete the questionnaire first.")
     else:
-        scores = [data["score"] for data in st.session_state["evaluations"].values()]
-        weak_areas = {q: d for q, d in st.session_state["evaluations"].items() if d["score"] < 3}
+        evaluations = list(st.session_state["evaluations"].items())
+        scores = st.session_state["score_array"]
+        weak_mask, mean_score, score_std = dashboard_stats(scores)
+        weak_areas = [evaluations[i] for i in np.flatnonzero(weak_mask)]
+        weak = int(weak_mask.sum())
+        strong = len(scores) - weak
         
-        fig, ax = plt.subplots()
-        ax.pie([len(scores) - len(weak_areas), len(weak_areas)], 
-               labels=["Strong", "Weak"], autopct="%1.1f%%", colors=["#4CAF50", "#FF5733"],
-               startangle=90)
-        ax.axis("equal")
         st.subheader("📌 Performance Breakdown")
-        st.pyplot(fig)
+        strong_col, weak_col, mean_col = st.columns(3)
+        strong_col.metric("Strong answers", strong)
+        weak_col.metric("Weak answers", weak)
+        mean_col.metric("Average score", f"{mean_score:.1f}", help=f"Standard deviation: {score_std:.1f}")
+        st.altair_chart(breakdown_chart(strong, weak), use_container_width=True)
         
         st.subheader("📖 Suggested Learning Plan")
         if weak_areas:
-            for q, data in weak_areas.items():
+            for q, data in weak_areas:
                 st.markdown(f"🔴 **{q}**")
                 st.write(f"Feedback: {data['feedback']}")
                 st.markdown("**Recommended Resources:**")
@@ -311,22 +451,18 @@ elif page == "Visual Insights":
     st.title("🎨 Visual Insights")
     if not st.session_state["notes"]:
         st.warning("No content generated. Please generate content first to create a diagram.")
+    elif not st.session_state["plantuml_code"]:
+        st.warning("No diagram was generated with this content. Please generate content again.")
     else:
-        if not st.session_state["plantuml_code"]:
-            with st.spinner("Generating PlantUML code from content..."):
-                plantuml_code = generate_plantuml_code(st.session_state["notes"])
-                st.session_state["plantuml_code"] = plantuml_code
-        else:
-            plantuml_code = st.session_state["plantuml_code"]
-        
-        if not st.session_state["diagram_path"]:
+        if not st.session_state["diagram"]:
             with st.spinner("Generating diagram using PlantUML..."):
-                diagram_path = generate_uml(plantuml_code, output_filename="diagram.png")
-                if diagram_path:
-                    st.session_state["diagram_path"] = diagram_path
+                try:
+                    st.session_state["diagram"] = generate_uml(st.session_state["plantuml_code"])
+                except ValueError as e:
+                    st.error(str(e))
         
-        if st.session_state["diagram_path"]:
-            st.image(st.session_state["diagram_path"], caption="Generated Diagram", use_column_width=True)
+        if st.session_state["diagram"]:
+            st.image(st.session_state["diagram"], caption="Generated Diagram", use_column_width=True)
             st.success("Diagram generated successfully.")
         
         if st.button("Show/Hide UML Code"):
@@ -353,14 +489,12 @@ elif page == "Lesson Planning":
         num_days = 1
     
     if st.button("Generate Lesson Plan"):
-        with st.spinner("Generating lesson plan..."):
-            lesson_text = generate_lesson_plan(
-                plan_type,
-                subject,
-                grade_level,
-                objectives,
-                num_days
-            )
         st.subheader("Your AI-Generated Plan")
-        st.write(lesson_text)
-        st.session_state["lesson_plan"] = lesson_text
+        plan_inputs = (plan_type, subject, grade_level, objectives, num_days)
+        # Same inputs as the last plan: show it again instead of re-streaming it from Gemini
+        if st.session_state["lesson_plan_inputs"] == plan_inputs:
+            st.write(st.session_state["lesson_plan"])
+        else:
+            lesson_text = st.write_stream(generate_lesson_plan(*plan_inputs))
+            st.session_state["lesson_plan"] = lesson_text
+            st.session_state["lesson_plan_inputs"] = plan_inputs
@@ -1,45 +1,101 @@
-from celery import Celery
-import os
-import json
-import re
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
+from celery import Celery, group
+from redis import Redis
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-
-# Load API Key from .env file
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+from langchain_core.output_parsers import StrOutputParser
+from langchain.cache import RedisCache
+from langchain.globals import set_llm_cache
+from _common import (
+    JSON_GENERATION_CONFIG, batch_json, format_answer_pairs, invoke_json, make_llm, normalize_answer, parse_json_object
+)
 
 # Initialize Celery (using Redis as broker; adjust the URL as needed)
-app = Celery('tasks', broker='redis://localhost:6379/0')
+BROKER_URL = 'redis://localhost:6379/0'
+app = Celery('tasks', broker=BROKER_URL)
+
+# Share one exact-match LLM cache across all workers, so the same question/answer pair from
+# many students is evaluated only once. It lives in its own Redis DB, apart from the broker's queues,
+# and entries expire so a stale evaluation is not served forever
+LLM_CACHE_URL = 'redis://localhost:6379/1'
+LLM_CACHE_TTL = 7 * 24 * 60 * 60
+
+class JsonRedisCache(RedisCache):
+    # Every chain here returns JSON; a malformed response is not stored, so one bad generation
+    # isn't served to every worker and student that sends the same pair
+    def update(self, prompt, llm_string, return_val):
+        if all(parse_json_object(generation.text) is not None for generation in return_val):
+            super().update(prompt, llm_string, return_val)
+
+set_llm_cache(JsonRedisCache(redis_=Redis.from_url(LLM_CACHE_URL), ttl=LLM_CACHE_TTL))
 
 # Initialize Gemini LLM via LangChain
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", google_api_key=GEMINI_API_KEY)
+llm = make_llm().bind(generation_config=JSON_GENERATION_CONFIG)
 
 # Define the evaluation prompt
 evaluation_prompt = PromptTemplate(
     input_variables=["question", "student_answer"],
     template=(
-        "You are an educational AI assistant. Evaluate the student's answer for the following question:\n"
-        "Question: {question}\n"
-        "Student Answer: {student_answer}\n"
+        "You are an educational AI assistant. Evaluate the student's answer for the question below.\n"
         "Provide a score between 1 and 10 and detailed feedback on how to improve the answer.\n"
-        "Return ONLY a valid JSON object with keys 'score' and 'feedback'."
+        "Return ONLY a valid JSON object with keys 'score' and 'feedback'.\n"
+        "\n---\nINPUT:\n"
+        "Question: {question}\n"
+        "Student Answer: {student_answer}"
     )
 )
-evaluation_chain = LLMChain(llm=llm, prompt=evaluation_prompt)
+evaluation_chain = evaluation_prompt | llm | StrOutputParser()
 
-def parse_json_response(response_text):
+# Define the prompt for evaluating several answers in one call
+batch_evaluation_prompt = PromptTemplate(
+    input_variables=["pairs"],
+    template=(
+        "You are an educational AI assistant. Evaluate each of the student's answers to the numbered questions below.\n"
+        "For each answer, provide a score between 1 and 10 and detailed feedback on how to improve the answer.\n"
+        "Return ONLY a valid JSON object with one key 'evaluations'. The value should be an array with one object per question, "
+        "in the same order as the questions, each with keys 'score' and 'feedback'.\n"
+        "\n---\nINPUT:\n"
+        "{pairs}"
+    )
+)
+batch_evaluation_chain = batch_evaluation_prompt | llm | StrOutputParser()
+
+# Number of answers packed into one batched prompt (one student's questionnaire)
+BATCH_SIZE = 5
+
+# Only a {score, feedback} object with a 1-10 score counts as an evaluation
+def checked_evaluation(evaluation):
+    if not isinstance(evaluation, dict) or not isinstance(evaluation.get("feedback"), str):
+        return None
     try:
-        json_str = re.search(r'\{.*\}', response_text, re.DOTALL).group()
-        return json.loads(json_str)
-    except Exception:
+        score = int(float(evaluation.get("score")))
+    except (TypeError, ValueError, OverflowError):
         return None
+    if not 1 <= score <= 10:
+        return None
+    return {**evaluation, "score": score}
 
 @app.task
 def evaluate_answer_task(question, student_answer):
     # Run the evaluation chain
-    response_text = evaluation_chain.run({"question": question, "student_answer": student_answer})
-    evaluation_data = parse_json_response(response_text)
-    return evaluation_data
+    evaluation_data = invoke_json(evaluation_chain, {"question": question, "student_answer": normalize_answer(student_answer)})
+    return checked_evaluation(evaluation_data)
+
+@app.task
+def evaluate_batch_task(pairs):
+    # One prompt for the whole batch shares the instruction preamble and a single round-trip
+    parsed = invoke_json(batch_evaluation_chain, {"pairs": format_answer_pairs(pairs)})
+    if isinstance(parsed, dict) and isinstance(parsed.get("evaluations"), list) and len(parsed["evaluations"]) == len(pairs):
+        evaluations = [checked_evaluation(evaluation) for evaluation in parsed["evaluations"]]
+        if all(evaluations):
+            return evaluations
+    # Fall back to one concurrent call per answer when the batch can't be matched to the questions
+    return [checked_evaluation(evaluation) for evaluation in batch_json(evaluation_chain, [
+        {"question": question, "student_answer": normalize_answer(student_answer)}
+        for question, student_answer in pairs
+    ])]
+
+def evaluate_answers(pairs):
+    # Fan BATCH_SIZE-answer batches out as parallel subtasks; .get() on the result returns
+    # one list of evaluations per batch, in submission order
+    return group(
+        evaluate_batch_task.s(pairs[start:start + BATCH_SIZE]) for start in range(0, len(pairs), BATCH_SIZE)
+    ).apply_async()